@@ -17,6 +17,54 @@ class UciNotFoundError(UciError):
 class UciParseError(UciError):
     pass
 
+def uci_escape(value):
+    """ escape a value for use inside single quotes like uci does """
+    return str(value).replace("'", "'\\''")
+
+def uci_split(line):
+    """ split a line into words like uci does
+
+    Words may be quoted with ' or " and '#' starts a comment only at the
+    start of a word.
+    """
+    words = []
+    word = None
+    quote = None
+    chars = iter(line)
+    for char in chars:
+        if quote == "'":
+            if char == "'":
+                quote = None
+            else:
+                word.append(char)
+        elif quote == '"':
+            if char == '"':
+                quote = None
+            elif char == '\\':
+                word.append(next(chars, ''))
+            else:
+                word.append(char)
+        elif char.isspace():
+            if word is not None:
+                words.append(''.join(word))
+                word = None
+        elif char == '#' and word is None:
+            break
+        else:
+            if word is None:
+                word = []
+            if char in '\'"':
+                quote = char
+            elif char == '\\':
+                word.append(next(chars, ''))
+            else:
+                word.append(char)
+    if quote:
+        raise UciParseError("unterminated quote")
+    if word is not None:
+        words.append(''.join(word))
+    return words
+
 class Diff(dict):
     """ class providing diffs on Config objects """
 
@@ -33,16 +81,21 @@ class Diff(dict):
     def importJson(self, jsonString):
         """ generate diff object from a json string """
         importDict = json.loads(jsonString)
-        
-        self.importPackage(importDict['newpackages'], 'newpackages')
-        self.importPackage(importDict['oldpackages'], 'oldpackages')
 
-        self.importConfig(importDict['newconfigs'], 'newconfigs')
-        self.importConfig(importDict['oldconfigs'], 'oldconfigs')
+        # everything below only reads the decoded json, any lookup failing
+        # here means the diff does not have the expected shape
+        try:
+            self.importPackage(importDict['newpackages'], 'newpackages')
+            self.importPackage(importDict['oldpackages'], 'oldpackages')
+
+            self.importConfig(importDict['newconfigs'], 'newconfigs')
+            self.importConfig(importDict['oldconfigs'], 'oldconfigs')
 
-        self.importOptions(importDict['newOptions'], 'newOptions')
-        self.importOptions(importDict['oldOptions'], 'oldOptions')
-        self.importOptions(importDict['chaOptions'], 'chaOptions')
+            self.importOptions(importDict['newOptions'], 'newOptions')
+            self.importOptions(importDict['oldOptions'], 'oldOptions')
+            self.importOptions(importDict['chaOptions'], 'chaOptions')
+        except (KeyError, IndexError, TypeError, AttributeError) as e:
+            raise UciParseError("invalid diff: %r" % e)
 
     def importPackage(self, packageDict, importTo):
         for packageName, package in packageDict.items():
@@ -51,16 +104,17 @@ class Diff(dict):
             self[importTo][packageName] = curPackage
 
     def importConfig(self, confDict, importTo):
-        for confName, confData in confDict.items():
-            indexTuple = (confData['package'], confName)
+        for confKey, confData in confDict.items():
             confValue = confData['value']
+            indexTuple = (confData['package'], confValue['.name'])
             config = Config(confValue.pop('.type'), confValue.pop('.name'), confValue.pop(".anonymous"))
             config.keys = confValue
             self[importTo][indexTuple] = config
 
     def importOptions(self, optDict, importTo):
-        for optName, optData in optDict.items():
-            indexTuple = (optData['package'], optData['config'], optName)
+        for optKey, optData in optDict.items():
+            # diffs written before the option field keyed options by name
+            indexTuple = (optData['package'], optData['config'], optData.get('option', optKey))
 
             # if it is a changed option treat values as a tuple (there is no tuple in json!)
             if importTo == 'chaOptions':
@@ -94,9 +148,11 @@ class Diff(dict):
         for confIndex, config in confDict.items():
             packageName = confIndex[0]
             configName = confIndex[1]
-            export[configName] = {}
-            export[configName]['value'] = config.export_dict(forjson=True)
-            export[configName]['package'] = packageName
+            # section names are only unique within a package
+            confKey = '%s.%s' % (packageName, configName)
+            export[confKey] = {}
+            export[confKey]['value'] = config.export_dict(forjson=True)
+            export[confKey]['package'] = packageName
         return export
 
     def exportOptions(self, optDict):
@@ -105,10 +161,13 @@ class Diff(dict):
             packageName = optIndex[0]
             configName = optIndex[1]
             optionName = optIndex[2]
-            export[optionName] = {}
-            export[optionName]['value'] = value
-            export[optionName]['package'] = packageName
-            export[optionName]['config'] = configName
+            # option names are only unique within a section
+            optKey = '%s.%s.%s' % (packageName, configName, optionName)
+            export[optKey] = {}
+            export[optKey]['value'] = value
+            export[optKey]['package'] = packageName
+            export[optKey]['config'] = configName
+            export[optKey]['option'] = optionName
         return export
 
     def diff(self, UciOld, UciNew):
@@ -183,13 +242,13 @@ class Diff(dict):
             toUci.del_config(configIndex[0], config)
 
         for optIndex, opt in self['newOptions'].items():
-            toUci.packages[optIndex[0]][optIndex[1]].set_option(optIndex[2], opt)
+            toUci.get_config(optIndex[0], optIndex[1]).set_option(optIndex[2], opt)
 
         for optIndex, opt in self['oldOptions'].items():
-            toUci.packages[optIndex[0]][optIndex[1]].remove_option(optIndex[2])
+            toUci.get_config(optIndex[0], optIndex[1]).remove_option(optIndex[2])
 
         for optIndex, opt in self['chaOptions'].items():
-            toUci.packages[optIndex[0]][optIndex[1]].set_option(optIndex[2], opt[1])
+            toUci.get_config(optIndex[0], optIndex[1]).set_option(optIndex[2], opt[1])
 
     def revert(self, toUci):
         """ reverts a diff from a Uci-Config """
@@ -206,13 +265,13 @@ class Diff(dict):
             toUci.add_config(configIndex[0], config)
 
         for optIndex, opt in self['newOptions'].items():
-            toUci.packages[optIndex[0]][optIndex[1]].remove_option(optIndex[2])
+            toUci.get_config(optIndex[0], optIndex[1]).remove_option(optIndex[2])
 
         for optIndex, opt in self['oldOptions'].items():
-            toUci.packages[optIndex[0]][optIndex[1]].set_option(optIndex[2], opt)
+            toUci.get_config(optIndex[0], optIndex[1]).set_option(optIndex[2], opt)
 
         for optIndex, opt in self['chaOptions'].items():
-            toUci.packages[optIndex[0]][optIndex[1]].set_option(optIndex[2], opt[0])
+            toUci.get_config(optIndex[0], optIndex[1]).set_option(optIndex[2], opt[0])
 
 class Config(object):
     def __init__(self, uci_type, name, anon):
@@ -225,6 +284,8 @@ class Config(object):
 
     def add_list(self, key, value):
         if key in self.keys:
+            if not isinstance(self.keys[key], list):
+                raise UciWrongTypeError("%s is an option and not a list" % key)
             self.keys[key].append(value)
         else:
             self.keys[key] = [value]
@@ -250,17 +311,24 @@ class Config(object):
         if key in self.keys:
             del self.keys[key]
 
+    def is_anonymous(self):
+        """ anon is whatever the source delivered - a bool or 'true'/'false' """
+        return self.anon in (True, 'true', '1')
+
     def export_uci(self):
         export = []
-        if not self.anon:
+        if not self.is_anonymous():
             export.append("config '%s' '%s'\n" % (self.uci_type, self.name))
         else:
             export.append("config '%s'\n" % (self.uci_type))
         for opt_list in self.keys:
+            # meta keys like .index are not options and rejected by uci
+            if opt_list.startswith('.'):
+                continue
             if isinstance(self.keys[opt_list], list):
-                export.extend([("\tlist '%s' '%s'\n" % (opt_list, element)) for element in self.keys[opt_list]])
+                export.extend([("\tlist '%s' '%s'\n" % (opt_list, uci_escape(element))) for element in self.keys[opt_list]])
             else:
-                export.append("\toption '%s' '%s'\n" % (opt_list, self.keys[opt_list]))
+                export.append("\toption '%s' '%s'\n" % (opt_list, uci_escape(self.keys[opt_list])))
         export.append('\n')
         return ''.join(export)
 
@@ -303,6 +371,8 @@ class Package(dict):
         self[config.name] = config
 
     def del_config(self, config):
+        if config.name not in self:
+            raise UciNotFoundError("section '%s.%s' not found" % (self.name, config.name))
         self.pop(config.name)
 
     def add_config_json(self, config):
@@ -347,17 +417,24 @@ class Uci(object):
         if not isinstance(config, Config):
             return RuntimeError()
         if package_name not in self.packages:
-            self.packages[package_name] = Package()
+            self.packages[package_name] = Package(package_name)
         self.packages[package_name].add_config(config)
 
+    def get_config(self, package_name, config_name):
+        if package_name not in self.packages:
+            raise UciNotFoundError("package '%s' not found" % package_name)
+        if config_name not in self.packages[package_name]:
+            raise UciNotFoundError("section '%s.%s' not found" % (package_name, config_name))
+        return self.packages[package_name][config_name]
+
     def del_config(self, package_name, config):
         if package_name not in self.packages:
-            raise RuntimeError()
+            raise UciNotFoundError("package '%s' not found" % package_name)
         self.packages[package_name].del_config(config)
 
     def del_package(self, package_name):
         if package_name not in self.packages:
-            raise RuntimeError()
+            raise UciNotFoundError("package '%s' not found" % package_name)
         self.packages.pop(package_name)
 
     def del_path(self, path):
@@ -374,19 +451,81 @@ class Uci(object):
     def diff(self, new):
         return Diff().diff(self, new)
 
-    def load_tree(self, export_tree_string):
+    def load_uci_tree(self, export_tree_string, package=None):
+        """ load a tree in the uci text format as written by export_uci_tree
+
+        Files like /etc/config/network have no package statement, their
+        sections go to the given package.
+        uci text carries neither meta keys like .index nor the names of
+        anonymous sections, those get new cfgXXXXXX names here.
+        """
         cur_package = None
         config = None
 
-        export_tree = json.loads(export_tree_string)
+        for lineno, line in enumerate(export_tree_string.splitlines(), 1):
+            try:
+                words = uci_split(line)
+            except UciParseError as e:
+                raise UciParseError("line %d: %s" % (lineno, e))
+            if not words:
+                continue
+            keyword = words[0]
+            if keyword == 'package' and len(words) == 2:
+                cur_package = self.add_package(words[1])
+                config = None
+            elif keyword == 'config' and len(words) in (2, 3):
+                if cur_package is None and package is not None:
+                    cur_package = self.add_package(package)
+                if cur_package is None:
+                    raise UciParseError("line %d: config outside of a package" % lineno)
+                if len(words) == 3:
+                    config = Config(words[1], words[2], 'false')
+                else:
+                    config = Config(words[1], self._anonymous_name(cur_package), 'true')
+                cur_package.add_config(config)
+            elif keyword in ('option', 'list') and len(words) == 3:
+                if config is None:
+                    raise UciParseError("line %d: %s outside of a config" % (lineno, keyword))
+                if keyword == 'option':
+                    config.set_option(words[1], words[2])
+                else:
+                    config.add_list(words[1], words[2])
+            else:
+                raise UciParseError("line %d: invalid statement '%s'" % (lineno, line.strip()))
+
+    def _anonymous_name(self, package):
+        index = len(package)
+        while 'cfg%06x' % index in package:
+            index += 1
+        return 'cfg%06x' % index
+
+    def load_tree(self, export_tree_string):
+        self.load_dict(json.loads(export_tree_string))
+
+    def load_dict(self, export_tree, packages=None):
+        """ load an already decoded json tree, optionally only the given packages
 
+        export_tree is left unchanged, sections and their lists are copied.
+        """
+        if not isinstance(export_tree, dict):
+            raise UciParseError("a tree must be a json object")
         for package in export_tree.keys():
+            if packages is not None and package not in packages:
+                continue
+            values = export_tree[package]
+            if not isinstance(values, dict) or not isinstance(values.get('values'), dict):
+                raise UciParseError("package '%s' has no values" % package)
             cur_package = self.add_package(package)
-            for config in export_tree[package]['values']:
-                config = export_tree[package]['values'][config]
+            for config in values['values'].values():
+                if not isinstance(config, dict) or \
+                        not all(key in config for key in ('.type', '.name', '.anonymous')):
+                    raise UciParseError("invalid section in package '%s'" % package)
+                # add_config_json consumes the dict and keeps the lists
+                config = dict((key, list(value) if isinstance(value, list) else value)
+                              for key, value in config.items())
                 cur_package.add_config_json(config)
 
-    def export_json(self):
+    def export_dict(self):
         export={}
         for packagename, package in self.packages.items():
             export[packagename] = {}
@@ -394,7 +533,10 @@ class Uci(object):
             for configname, config in package.items():
                 export[packagename]['values'][config.name] =\
                     config.export_dict(forjson=True)
-        return json.dumps(export)
+        return export
+
+    def export_json(self):
+        return json.dumps(self.export_dict())
 
     def __eq__(self, other):
         return self.packages == other.packages
@@ -403,13 +545,3 @@ class Uci(object):
 class UciConfig(object):
     """ Class for configurations - like network... """
     pass
-
-if __name__ == '__main__':
-    uci_export = open('uci_export')
-    alles = uci_export.read(1000000)
-    logging.basicConfig()
-    ucilog = logging.getLogger('uci')
-    ucilog.setLevel(logging.DEBUG)
-    uci = Uci()
-    uci.load_tree(alles)
-    print(uci.export_tree())
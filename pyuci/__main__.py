@@ -0,0 +1,5 @@
+import sys
+
+from pyuci.cli import main
+
+sys.exit(main())
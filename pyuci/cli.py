@@ -0,0 +1,348 @@
+""" uci-like command line interface
+
+Trees are read from json (as exported by Uci.export_json), uci text (as
+exported by Uci.export_uci_tree) or fleet snapshots (see pyuci.fleet).
+Commands which modify the tree write it back in the format it was read.
+Converting to uci text drops meta keys like .index and the names of
+anonymous sections, so a diff against the original json reports the
+anonymous sections as removed and added again.
+
+The batch command reads one command per line from stdin and applies all
+of them to the tree before it is written once:
+
+    $ pyuci -c config.json batch <<EOF
+    set network.lan.ipaddr=192.168.2.1
+    add_list system.ntp.server=0.pool.ntp.org
+    delete dhcp.wan
+    EOF
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+
+from pyuci import Config, Diff, Uci, UciError, UciNotFoundError, uci_escape, uci_split
+
+FORMATS = ('json', 'uci', 'snapshot')
+
+
+def _detect(text):
+    """ return the format of text and the decoded tree if detection parsed it """
+    head = text.lstrip()
+    if not head.startswith('{'):
+        return 'uci', None
+    first, sep, rest = head.partition('\n')
+    try:
+        decoded = json.loads(first)
+    except ValueError:
+        # json spread over several lines
+        return 'json', None
+    if isinstance(decoded, dict) and 'format' in decoded:
+        from pyuci.fleet import FORMAT
+        if decoded['format'] == FORMAT:
+            return 'snapshot', None
+    if rest.strip():
+        return 'json', None
+    # single line json trees are only decoded once
+    return 'json', decoded
+
+
+def detect_format(text):
+    return _detect(text)[0]
+
+
+def load(text, fmt=None, device=None, path=None):
+    """ build a Uci from text, a snapshot yields the given or the first device
+
+    uci text without a package statement belongs to the package named like
+    the file at path, as in /etc/config. Returns the Uci and the format of
+    text.
+    """
+    tree = None
+    if fmt is None:
+        fmt, tree = _detect(text)
+    uci = Uci()
+    if fmt == 'json':
+        if tree is None:
+            uci.load_tree(text)
+        else:
+            uci.load_dict(tree)
+    elif fmt == 'uci':
+        package = None
+        if path is not None and path != '-':
+            package = os.path.splitext(os.path.basename(path))[0]
+        uci.load_uci_tree(text, package)
+    else:
+        # the fleet backend is only needed for snapshots
+        from pyuci.fleet import read_fleet
+        devices = None if device is None else [device]
+        for device_id, uci in read_fleet(io.StringIO(text), devices):
+            break
+        else:
+            raise UciNotFoundError("device '%s' not found in snapshot" % device)
+    return uci, fmt
+
+
+def dump(uci, fmt, device='default'):
+    if fmt == 'json':
+        return uci.export_json() + '\n'
+    elif fmt == 'uci':
+        return uci.export_uci_tree()
+    from pyuci.fleet import write_fleet
+    stream = io.StringIO()
+    write_fleet(stream, [(device, uci)])
+    return stream.getvalue()
+
+
+def read_file(path):
+    if path == '-':
+        return sys.stdin.read()
+    with open(path) as f:
+        return f.read()
+
+
+def write_file(path, text):
+    if path == '-':
+        sys.stdout.write(text)
+        return
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def split_assignment(expression):
+    path, sep, value = expression.partition('=')
+    if not sep:
+        raise UciError("expected <path>=<value> but got '%s'" % expression)
+    return path, value
+
+
+def split_path(uci, path):
+    """ resolve package[.section[.option]] to (package, config, option) """
+    parts = path.split('.', 2)
+    package = uci.packages.get(parts[0])
+    if package is None:
+        raise UciNotFoundError("package '%s' not found" % parts[0])
+    if len(parts) == 1:
+        return package, None, None
+    config = find_config(package, parts[1])
+    option = parts[2] if len(parts) == 3 else None
+    return package, config, option
+
+
+def find_config(package, section):
+    """ find a section by name or by an uci reference like @type[index] """
+    if not section.startswith('@'):
+        if section not in package:
+            raise UciNotFoundError("section '%s.%s' not found" % (package.name, section))
+        return package[section]
+    uci_type, sep, index = section[1:].partition('[')
+    try:
+        index = int(index.rstrip(']')) if sep else 0
+        return [config for config in package.values() if config.uci_type == uci_type][index]
+    except (ValueError, IndexError):
+        raise UciNotFoundError("section '%s.%s' not found" % (package.name, section))
+
+
+def section_path(package, config):
+    if not config.is_anonymous():
+        return '%s.%s' % (package.name, config.name)
+    same_type = [c for c in package.values() if c.uci_type == config.uci_type]
+    return '%s.@%s[%d]' % (package.name, config.uci_type, same_type.index(config))
+
+
+def format_value(value):
+    if isinstance(value, list):
+        return ' '.join("'%s'" % uci_escape(element) for element in value)
+    return "'%s'" % uci_escape(value)
+
+
+def cmd_show(uci, path, out):
+    if path:
+        package, config, option = split_path(uci, path)
+        if option is not None and option not in config.keys:
+            raise UciNotFoundError("option '%s' not found" % path)
+        packages = [package]
+    else:
+        package = config = option = None
+        packages = uci.packages.values()
+    for package in packages:
+        configs = [config] if config is not None else package.values()
+        for cur_config in configs:
+            prefix = section_path(package, cur_config)
+            if option is None:
+                out.write('%s=%s\n' % (prefix, cur_config.uci_type))
+            for key, value in cur_config.keys.items():
+                if key.startswith('.') or option not in (None, key):
+                    continue
+                out.write('%s.%s=%s\n' % (prefix, key, format_value(value)))
+
+
+def cmd_get(uci, path, out):
+    package, config, option = split_path(uci, path)
+    if config is None:
+        out.write('package\n')
+    elif option is None:
+        out.write('%s\n' % config.uci_type)
+    elif option not in config.keys:
+        raise UciNotFoundError("option '%s' not found" % path)
+    elif isinstance(config.keys[option], list):
+        out.write('%s\n' % ' '.join(config.keys[option]))
+    else:
+        out.write('%s\n' % config.keys[option])
+
+
+def cmd_set(uci, expression, out):
+    path, value = split_assignment(expression)
+    parts = path.split('.', 2)
+    if len(parts) == 1:
+        raise UciError("cannot set package '%s'" % path)
+    if len(parts) == 2:
+        package = uci.add_package(parts[0])
+        try:
+            find_config(package, parts[1]).uci_type = value
+        except UciNotFoundError:
+            if parts[1].startswith('@'):
+                raise
+            package.add_config(Config(value, parts[1], 'false'))
+        return
+    package, config, option = split_path(uci, path)
+    config.set_option(option, value)
+
+
+def cmd_add_list(uci, expression, out):
+    path, value = split_assignment(expression)
+    package, config, option = split_path(uci, path)
+    if config is None or option is None:
+        raise UciError("add_list needs an option path but got '%s'" % path)
+    config.add_list(option, value)
+
+
+def cmd_delete(uci, path, out):
+    package, config, option = split_path(uci, path)
+    if config is None:
+        uci.del_package(package.name)
+    elif option is None:
+        package.del_config(config)
+    elif option not in config.keys:
+        raise UciNotFoundError("option '%s' not found" % path)
+    else:
+        config.remove_option(option)
+
+
+# name -> (function, modifies the tree)
+TREE_COMMANDS = {
+    'show': (cmd_show, False),
+    'get': (cmd_get, False),
+    'set': (cmd_set, True),
+    'add_list': (cmd_add_list, True),
+    'delete': (cmd_delete, True),
+}
+
+
+def run_batch(uci, lines, out):
+    """ run tree commands read from lines, returns whether the tree changed """
+    changed = False
+    for lineno, line in enumerate(lines, 1):
+        try:
+            words = uci_split(line)
+        except UciError as e:
+            raise UciError("line %d: %s" % (lineno, e))
+        if not words:
+            continue
+        if words[0] not in TREE_COMMANDS or len(words) > 2 or \
+                (len(words) == 1 and words[0] != 'show'):
+            raise UciError("line %d: invalid command '%s'" % (lineno, line.strip()))
+        function, modifies = TREE_COMMANDS[words[0]]
+        try:
+            function(uci, words[1] if len(words) == 2 else None, out)
+        except UciError as e:
+            raise UciError("line %d: %s" % (lineno, e))
+        changed = changed or modifies
+    return changed
+
+
+def parser():
+    parser = argparse.ArgumentParser(prog='pyuci', description='uci-like access to uci trees')
+    parser.add_argument('-c', '--config', help='tree to work on (json, uci text or snapshot)')
+    parser.add_argument('-d', '--device', help='device to use from a snapshot')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    command = commands.add_parser('show', help='show the tree or a part of it')
+    command.add_argument('path', nargs='?')
+    command = commands.add_parser('get', help='print a value')
+    command.add_argument('path')
+    command = commands.add_parser('set', help='set an option or create a section')
+    command.add_argument('path', metavar='path=value')
+    command = commands.add_parser('add_list', help='append a value to a list')
+    command.add_argument('path', metavar='path=value')
+    command = commands.add_parser('delete', help='delete a package, section or option')
+    command.add_argument('path')
+    commands.add_parser('batch', help='run commands from stdin with one write at the end')
+
+    command = commands.add_parser('diff', help='print the json diff to another tree')
+    command.add_argument('other')
+    command = commands.add_parser('apply', help='apply a json diff')
+    command.add_argument('diff')
+    command = commands.add_parser('export', help='print the tree')
+    command.add_argument('-t', '--to', choices=FORMATS, default='json')
+
+    command = commands.add_parser('convert', help='convert a tree between formats')
+    command.add_argument('input', help="input file or '-' for stdin")
+    command.add_argument('output', help="output file or '-' for stdout")
+    command.add_argument('-f', '--from', dest='from_format', choices=FORMATS,
+                         help='input format, detected if omitted')
+    command.add_argument('-t', '--to', choices=FORMATS, required=True)
+    return parser
+
+
+def main(argv=None, out=None):
+    out = out or sys.stdout
+    args = parser().parse_args(argv)
+    try:
+        if args.command == 'convert':
+            uci, fmt = load(read_file(args.input), args.from_format, args.device, args.input)
+            device = args.device
+            if device is None:
+                device = 'default' if args.input == '-' else os.path.splitext(os.path.basename(args.input))[0]
+            write_file(args.output, dump(uci, args.to, device))
+            return 0
+
+        if args.config is None:
+            raise UciError("%s needs a tree, use -c" % args.command)
+        if args.config == '-' and (args.command == 'batch' or '-' in (getattr(args, 'other', None),
+                                                                      getattr(args, 'diff', None))):
+            raise UciError("%s reads stdin, the tree cannot be read from stdin too" % args.command)
+        text = read_file(args.config)
+        uci, fmt = load(text, device=args.device, path=args.config)
+
+        if args.command in TREE_COMMANDS:
+            function, changed = TREE_COMMANDS[args.command]
+            function(uci, args.path, out)
+        elif args.command == 'batch':
+            changed = run_batch(uci, sys.stdin, out)
+        elif args.command == 'diff':
+            other, other_fmt = load(read_file(args.other), device=args.device, path=args.other)
+            out.write(uci.diff(other).exportJson() + '\n')
+            changed = False
+        elif args.command == 'apply':
+            diff = Diff()
+            diff.importJson(read_file(args.diff))
+            diff.apply(uci)
+            changed = True
+        elif args.command == 'export':
+            out.write(dump(uci, args.to, args.device or 'default'))
+            changed = False
+
+        if changed:
+            if fmt == 'snapshot':
+                raise UciError("snapshots are read-only, convert the device first")
+            write_file(args.config, dump(uci, fmt))
+    except (UciError, OSError, ValueError) as e:
+        sys.stderr.write('pyuci: %s\n' % e)
+        return 1
+    return 0
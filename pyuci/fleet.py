@@ -0,0 +1,287 @@
+""" export and import many uci trees through one stream
+
+A fleet stream starts with a header line naming the layout, followed by
+records which are one json document per line:
+
+ndjson
+    one record per device: {"device": <id>, "packages": <Uci.export_dict()>}
+
+columnar
+    one record per block of devices. Package names, section types and
+    option names are stored once per block in a string table and the
+    tree is split into the tables packages, sections and options whose
+    columns reference rows of the table above.
+
+Device ids are strings or integers. Readers and writers only keep a
+single record in memory, so the size of a fleet is not limited by the
+available memory.
+"""
+
+import json
+
+from pyuci import Config, Uci, UciParseError
+
+FORMAT = 'pyuci-fleet'
+VERSION = 1
+LAYOUTS = ('ndjson', 'columnar')
+
+_DEVICE_PREFIX = '{"device": '
+_decoder = json.JSONDecoder()
+
+
+class _ColumnarBlock(object):
+    """ a block of devices in the columnar layout """
+
+    def __init__(self):
+        self.strings = []
+        self.string_index = {}
+        self.devices = []
+        self.packages = {'device': [], 'name': []}
+        self.sections = {'package': [], 'name': [], 'type': [], 'anonymous': []}
+        self.options = {'section': [], 'name': [], 'value': []}
+
+    def __len__(self):
+        return len(self.devices)
+
+    def intern(self, string):
+        index = self.string_index.get(string)
+        if index is None:
+            index = len(self.strings)
+            self.string_index[string] = index
+            self.strings.append(string)
+        return index
+
+    def add(self, device_id, uci):
+        device = len(self.devices)
+        self.devices.append(device_id)
+        packages = self.packages
+        sections = self.sections
+        options = self.options
+        for packagename, package in uci.packages.items():
+            package_row = len(packages['name'])
+            packages['device'].append(device)
+            packages['name'].append(self.intern(packagename))
+            for config in package.values():
+                section_row = len(sections['name'])
+                sections['package'].append(package_row)
+                sections['name'].append(config.name)
+                sections['type'].append(self.intern(config.uci_type))
+                sections['anonymous'].append(config.anon)
+                for key, value in config.keys.items():
+                    options['section'].append(section_row)
+                    options['name'].append(self.intern(key))
+                    options['value'].append(value)
+
+    def export_dict(self):
+        return {
+            'strings': self.strings,
+            'devices': self.devices,
+            'packages': self.packages,
+            'sections': self.sections,
+            'options': self.options,
+        }
+
+
+class FleetWriter(object):
+    """ write (device_id, Uci) pairs to a text stream
+
+    In the columnar layout up to block_size devices are collected before
+    a record is written. Call close() or use the writer as a context
+    manager to write the last block.
+    """
+
+    def __init__(self, stream, layout='ndjson', block_size=1024):
+        if layout not in LAYOUTS:
+            raise ValueError("unknown fleet layout '%s'" % layout)
+        self.stream = stream
+        self.layout = layout
+        self.block_size = block_size
+        self.block = _ColumnarBlock()
+        header = {'format': FORMAT, 'version': VERSION, 'layout': layout}
+        self.stream.write(json.dumps(header) + '\n')
+
+    def write(self, device_id, uci):
+        if isinstance(device_id, bool) or not isinstance(device_id, (str, int)):
+            raise ValueError("device ids must be strings or integers")
+        if self.layout == 'ndjson':
+            # the device id is always written first, so readers can skip
+            # unwanted devices without decoding their tree
+            self.stream.write('%s%s, "packages": %s}\n' % (
+                _DEVICE_PREFIX, json.dumps(device_id), json.dumps(uci.export_dict())))
+            return
+        self.block.add(device_id, uci)
+        if len(self.block) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.block):
+            self.stream.write(json.dumps(self.block.export_dict()) + '\n')
+            self.block = _ColumnarBlock()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_fleet(stream, trees, layout='ndjson', block_size=1024):
+    """ write an iterable of (device_id, Uci) pairs to stream """
+    with FleetWriter(stream, layout, block_size) as writer:
+        for device_id, uci in trees:
+            writer.write(device_id, uci)
+
+
+def _check_device_id(device_id):
+    if isinstance(device_id, bool) or not isinstance(device_id, (str, int)):
+        raise UciParseError("invalid device id %r" % (device_id,))
+    return device_id
+
+
+def _decode_record(line):
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        raise UciParseError("invalid fleet record: %s" % e)
+    if not isinstance(record, dict):
+        raise UciParseError("fleet record is not a json object")
+    return record
+
+
+def _columns(block, table, names):
+    """ return the columns of a table in a block, all lists of one length """
+    columns = block.get(table)
+    if not isinstance(columns, dict):
+        raise UciParseError("fleet block has no %s table" % table)
+    result = [columns.get(name) for name in names]
+    if not all(isinstance(column, list) for column in result) or \
+            len(set(len(column) for column in result)) > 1:
+        raise UciParseError("invalid columns in %s table" % table)
+    return result
+
+
+def _row(rows, index, table):
+    if isinstance(index, bool) or not isinstance(index, int) or not 0 <= index < len(rows):
+        raise UciParseError("invalid reference %r to the %s table" % (index, table))
+    return rows[index]
+
+
+def _read_ndjson(lines, devices, packages):
+    for line in lines:
+        if not line.strip():
+            continue
+        if devices is not None and line.startswith(_DEVICE_PREFIX):
+            try:
+                device_id, end = _decoder.raw_decode(line, len(_DEVICE_PREFIX))
+            except ValueError as e:
+                raise UciParseError("invalid fleet record: %s" % e)
+            if _check_device_id(device_id) not in devices:
+                continue
+        record = _decode_record(line)
+        if 'device' not in record or 'packages' not in record:
+            raise UciParseError("fleet record needs device and packages")
+        device_id = _check_device_id(record['device'])
+        if devices is not None and device_id not in devices:
+            continue
+        uci = Uci()
+        uci.load_dict(record['packages'], packages)
+        yield device_id, uci
+
+
+def _read_columnar(lines, devices, packages):
+    for line in lines:
+        if not line.strip():
+            continue
+        block = _decode_record(line)
+        strings = block.get('strings')
+        device_ids = block.get('devices')
+        if not isinstance(strings, list) or not all(isinstance(string, str) for string in strings):
+            raise UciParseError("fleet block has no string table")
+        if not isinstance(device_ids, list):
+            raise UciParseError("fleet block has no devices")
+
+        trees = []
+        for device_id in device_ids:
+            _check_device_id(device_id)
+            if devices is not None and device_id not in devices:
+                trees.append(None)
+            else:
+                trees.append(Uci())
+
+        package_rows = []
+        for device, name in zip(*_columns(block, 'packages', ('device', 'name'))):
+            uci = _row(trees, device, 'devices')
+            name = _row(strings, name, 'strings')
+            if uci is None or (packages is not None and name not in packages):
+                package_rows.append(None)
+            else:
+                package_rows.append(uci.add_package(name))
+
+        section_rows = []
+        columns = _columns(block, 'sections', ('package', 'name', 'type', 'anonymous'))
+        for package, name, uci_type, anon in zip(*columns):
+            package = _row(package_rows, package, 'packages')
+            if not isinstance(name, str):
+                raise UciParseError("invalid section name %r" % (name,))
+            if package is None:
+                section_rows.append(None)
+            else:
+                config = Config(_row(strings, uci_type, 'strings'), name, anon)
+                package.add_config(config)
+                section_rows.append(config)
+
+        for section, name, value in zip(*_columns(block, 'options', ('section', 'name', 'value'))):
+            config = _row(section_rows, section, 'sections')
+            name = _row(strings, name, 'strings')
+            if config is not None:
+                config.keys[name] = value
+
+        for device_id, uci in zip(device_ids, trees):
+            if uci is not None:
+                yield device_id, uci
+
+
+def read_fleet(stream, devices=None, packages=None):
+    """ yield (device_id, Uci) pairs from a fleet stream
+
+    devices and packages restrict the result to the given device ids and
+    package names. When devices are given only the first record of each
+    requested device is returned and reading stops as soon as all of them
+    were found.
+    """
+    header = stream.readline()
+    try:
+        header = json.loads(header)
+    except ValueError:
+        raise UciParseError("missing fleet header")
+    if not isinstance(header, dict) or header.get('format') != FORMAT:
+        raise UciParseError("not a fleet stream")
+    if header.get('version') != VERSION:
+        raise UciParseError("unsupported fleet version %s" % header.get('version'))
+    layout = header.get('layout')
+    if layout == 'ndjson':
+        reader = _read_ndjson
+    elif layout == 'columnar':
+        reader = _read_columnar
+    else:
+        raise UciParseError("unknown fleet layout '%s'" % layout)
+
+    if devices is not None:
+        # found devices are removed, so the readers skip later duplicates
+        devices = set(devices)
+        if not devices:
+            return
+    if packages is not None:
+        packages = set(packages)
+
+    for device_id, uci in reader(stream, devices, packages):
+        if devices is not None:
+            if device_id not in devices:
+                continue
+            devices.discard(device_id)
+        yield device_id, uci
+        if devices is not None and not devices:
+            return
@@ -26,5 +26,8 @@ classifiers=[
 ],
 keywords='uci openwrt',
 packages=find_packages(exclude=['contrib', 'docs', 'tests*']),
-install_requires=[]
+install_requires=[],
+entry_points={
+'console_scripts': ['pyuci=pyuci.cli:main'],
+},
 )
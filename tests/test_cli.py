@@ -0,0 +1,167 @@
+from pyuci import Uci
+from pyuci.cli import detect_format, main
+import io
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        path,filename = os.path.split(os.path.realpath(__file__))
+        self.tmpdir = tempfile.mkdtemp()
+        self.original = os.path.join(path,'example_config')
+        self.config = os.path.join(self.tmpdir, 'config.json')
+        shutil.copy(self.original, self.config)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_cli(self, *argv, stdin=''):
+        out = io.StringIO()
+        orig_stdin = sys.stdin
+        sys.stdin = io.StringIO(stdin)
+        try:
+            result = main(list(argv), out)
+        finally:
+            sys.stdin = orig_stdin
+        return result, out.getvalue()
+
+    def load(self, path):
+        uci = Uci()
+        uci.load_tree(open(path).read())
+        return uci
+
+    def test_get_set(self):
+        self.assertEqual(self.run_cli('-c', self.config, 'get', 'system.@system[0].hostname'),
+                         (0, 'OpenWrt\n'))
+        self.assertEqual(self.run_cli('-c', self.config, 'set', 'system.@system[0].hostname=ap1'),
+                         (0, ''))
+        self.assertEqual(self.load(self.config).packages['system']['cfg02e48a'].keys['hostname'], 'ap1')
+        self.assertEqual(self.run_cli('-c', self.config, 'get', 'system.nothere')[0], 1)
+
+    def test_invalid_tree(self):
+        for text in ['{"device": "a", "packages": {}}', '[]', '{"p": {"values": {"s": {}}}}']:
+            open(self.config, 'w').write(text)
+            self.assertEqual(self.run_cli('-c', self.config, 'show'), (1, ''))
+
+    def test_show(self):
+        result, output = self.run_cli('-c', self.config, 'show', 'dhcp.wan')
+        self.assertEqual(result, 0)
+        self.assertEqual(output.splitlines(),
+                         ['dhcp.wan=dhcp', "dhcp.wan.ignore='1'", "dhcp.wan.interface='wan'"])
+
+        self.run_cli('-c', self.config, 'set', "dhcp.wan.interface=it's")
+        self.assertEqual(self.run_cli('-c', self.config, 'show', 'dhcp.wan.interface'),
+                         (0, "dhcp.wan.interface='it'\\''s'\n"))
+        self.assertEqual(self.run_cli('-c', self.config, 'show', 'dhcp.wan.nothere'), (1, ''))
+
+    def test_batch(self):
+        commands = '\n'.join([
+            '# comment',
+            'set network.lan.ipaddr=10.0.0.1',
+            'set network.guest=interface',
+            'add_list network.guest.dns=1.1.1.1',
+            'add_list network.guest.dns="8.8.8.8"',
+            'delete dhcp.wan',
+            'get network.guest.dns',
+        ])
+        self.assertEqual(self.run_cli('-c', self.config, 'batch', stdin=commands),
+                         (0, '1.1.1.1 8.8.8.8\n'))
+        uci = self.load(self.config)
+        self.assertEqual(uci.packages['network']['lan'].keys['ipaddr'], '10.0.0.1')
+        self.assertEqual(uci.packages['network']['guest'].keys['dns'], ['1.1.1.1', '8.8.8.8'])
+        self.assertNotIn('wan', uci.packages['dhcp'])
+
+        # the tree and the commands cannot both come from stdin
+        self.assertEqual(self.run_cli('-c', '-', 'batch', stdin=open(self.config).read()), (1, ''))
+
+        # a failing command leaves the tree untouched
+        before = open(self.config).read()
+        result, output = self.run_cli('-c', self.config, 'batch',
+                                      stdin='set network.lan.ipaddr=1.2.3.4\ndelete nothere\n')
+        self.assertEqual(result, 1)
+        self.assertEqual(open(self.config).read(), before)
+
+    def test_diff_apply(self):
+        self.run_cli('-c', self.config, 'set', 'network.lan.ipaddr=10.0.0.1')
+        diff = os.path.join(self.tmpdir, 'diff.json')
+        result, output = self.run_cli('-c', self.original, 'diff', self.config)
+        self.assertEqual(result, 0)
+        open(diff, 'w').write(output)
+
+        other = os.path.join(self.tmpdir, 'other.json')
+        shutil.copy(self.original, other)
+        self.assertEqual(self.run_cli('-c', other, 'apply', diff), (0, ''))
+        self.assertEqual(self.load(other), self.load(self.config))
+
+        # a diff which does not match the tree is an error and nothing is written
+        small = os.path.join(self.tmpdir, 'small.uci')
+        open(small, 'w').write("package 'network'\n\nconfig 'interface' 'wan'\n")
+        result, output = self.run_cli('-c', small, 'apply', diff)
+        self.assertEqual(result, 1)
+        self.assertEqual(open(small).read(), "package 'network'\n\nconfig 'interface' 'wan'\n")
+
+        open(diff, 'w').write('{"newpackages": []}')
+        self.assertEqual(self.run_cli('-c', small, 'apply', diff), (1, ''))
+
+    def test_uci_comments(self):
+        uci = Uci()
+        uci.load_uci_tree("# comment\npackage 'p'\nconfig t 'n' # comment\n"
+                          "\toption u a#b\n\toption v 'c#d' #e\n")
+        self.assertEqual(uci.packages['p']['n'].keys, {'u': 'a#b', 'v': 'c#d'})
+
+        self.assertEqual(self.run_cli('-c', self.config, 'batch', stdin='set network.lan.ipaddr=a#b # c\n'),
+                         (0, ''))
+        self.assertEqual(self.load(self.config).packages['network']['lan'].keys['ipaddr'], 'a#b')
+
+    def test_config_file(self):
+        # files in /etc/config have no package statement
+        network = os.path.join(self.tmpdir, 'network')
+        open(network, 'w').write("config interface 'lan'\n\toption proto 'static'\n")
+        output = os.path.join(self.tmpdir, 'network.json')
+        self.assertEqual(self.run_cli('convert', network, output, '-t', 'json'), (0, ''))
+        self.assertEqual(self.load(output).packages['network']['lan'].keys, {'proto': 'static'})
+        self.assertEqual(self.run_cli('-c', network, 'get', 'network.lan.proto'), (0, 'static\n'))
+
+    def test_convert(self):
+        text = os.path.join(self.tmpdir, 'config.uci')
+        snapshot = os.path.join(self.tmpdir, 'fleet')
+        back = os.path.join(self.tmpdir, 'back.json')
+        self.assertEqual(self.run_cli('convert', self.config, text, '-t', 'uci'), (0, ''))
+        self.assertEqual(self.run_cli('convert', text, snapshot, '-t', 'snapshot'), (0, ''))
+        self.assertEqual(self.run_cli('-c', snapshot, '-d', 'config', 'get', 'network.lan.proto'),
+                         (0, 'static\n'))
+        self.assertEqual(self.run_cli('-c', snapshot, 'set', 'network.lan.proto=dhcp')[0], 1)
+        self.assertEqual(self.run_cli('convert', snapshot, back, '-t', 'json'), (0, ''))
+
+        # headers from other writers may order keys and space differently
+        lines = open(snapshot).read().splitlines(True)
+        lines[0] = '{"layout":"ndjson","version":1,"format":"pyuci-fleet"}\n'
+        open(snapshot, 'w').write(''.join(lines))
+        self.assertEqual(detect_format(open(snapshot).read()), 'snapshot')
+        self.assertEqual(self.run_cli('-c', snapshot, 'get', 'network.lan.proto'), (0, 'static\n'))
+
+        self.assertNotIn("'.index'", open(text).read())
+        uci = Uci()
+        uci.load_uci_tree(open(text).read())
+        self.assertEqual(self.load(back), uci)
+
+        # uci text keeps options and sections but neither .index nor the
+        # names of anonymous sections, compare those by type and position
+        def sections(uci):
+            result = {}
+            for packagename, package in uci.packages.items():
+                for config in package.values():
+                    name = config.name
+                    if config.is_anonymous():
+                        name = '@%s[%d]' % (config.uci_type, len([key for key in result
+                            if key[0] == packagename and key[1].startswith('@%s[' % config.uci_type)]))
+                    keys = dict((key, value) for key, value in config.keys.items()
+                                if not key.startswith('.'))
+                    result[(packagename, name)] = (config.uci_type, config.is_anonymous(), keys)
+            return result
+        self.assertEqual(sections(self.load(back)), sections(self.load(self.original)))
+        self.assertEqual(self.run_cli('-c', back, 'export', '-t', 'uci')[1],
+                         self.load(self.config).export_uci_tree())
@@ -1,4 +1,4 @@
-from pyuci import Uci, Diff
+from pyuci import Uci, Diff, UciNotFoundError, UciParseError
 import os.path
 import unittest
 import json
@@ -104,7 +104,7 @@ class TestSetup(unittest.TestCase):
         jsonExport = result.exportJson()
         configJsonString = json.dumps(self.confb.packages[removed_key][removed_conf].export_dict(forjson=True))
         expected = '{"newpackages": {}, "oldpackages": {}, "newconfigs": '
-        expected += '{"' + removed_conf + '": {"value": ' + configJsonString + ', "package": "' + removed_key + '"}}'
+        expected += '{"' + removed_key + '.' + removed_conf + '": {"value": ' + configJsonString + ', "package": "' + removed_key + '"}}'
         expected += ', "oldconfigs": {}, "newOptions": {}, "oldOptions": {}, "chaOptions": {}}'
         self.assertEqual(json.loads(jsonExport), json.loads(expected))
         importTest = Diff()
@@ -132,7 +132,7 @@ class TestSetup(unittest.TestCase):
         jsonExport = result.exportJson()
         configJsonString = json.dumps(self.confa.packages[removed_key][removed_conf].export_dict(forjson=True))
         expected = '{"newpackages": {}, "oldpackages": {}, "newconfigs": {}, "oldconfigs": '
-        expected += '{"' + removed_conf + '": {"value": ' + configJsonString + ', "package": "' + removed_key + '"}}'
+        expected += '{"' + removed_key + '.' + removed_conf + '": {"value": ' + configJsonString + ', "package": "' + removed_key + '"}}'
         expected += ', "newOptions": {}, "oldOptions": {}, "chaOptions": {}}'
         self.assertEqual(json.loads(jsonExport), json.loads(expected))
         importTest = Diff()
@@ -164,7 +164,7 @@ class TestSetup(unittest.TestCase):
         jsonExport = result.exportJson()
         removedOptVal = removed_option_dict[(removed_key, removed_conf, removed_option)]
         expected = '{"newpackages": {}, "oldpackages": {}, "newconfigs": {}, "oldconfigs": {}, "newOptions": {"'
-        expected += removed_option+ '": {"value": "' + removedOptVal + '", "package": "' + removed_key + '", "config": "' + removed_conf + '"'
+        expected += removed_key + '.' + removed_conf + '.' + removed_option + '": {"value": "' + removedOptVal + '", "package": "' + removed_key + '", "config": "' + removed_conf + '", "option": "' + removed_option + '"'
         expected += '}}, "oldOptions": {}, "chaOptions": {}}'
         self.assertEqual(json.loads(jsonExport), json.loads(expected))
         importTest = Diff()
@@ -196,7 +196,7 @@ class TestSetup(unittest.TestCase):
         jsonExport = result.exportJson()
         removedOptVal = removed_option_dict[(removed_key, removed_conf, removed_option)]
         expected = '{"newpackages": {}, "oldpackages": {}, "newconfigs": {}, "oldconfigs": {}, "newOptions": {}, "oldOptions": {"'
-        expected += removed_option+ '": {"value": "' + removedOptVal + '", "package": "' + removed_key + '", "config": "' + removed_conf + '"'
+        expected += removed_key + '.' + removed_conf + '.' + removed_option + '": {"value": "' + removedOptVal + '", "package": "' + removed_key + '", "config": "' + removed_conf + '", "option": "' + removed_option + '"'
         expected += '}}, "chaOptions": {}}'
         self.assertEqual(json.loads(jsonExport), json.loads(expected))
         importTest = Diff()
@@ -233,7 +233,7 @@ class TestSetup(unittest.TestCase):
         jsonExport = result.exportJson()
         removedOptVal = removed_option_dict[(removed_key, removed_conf, removed_option)]
         expected = '{"newpackages": {}, "oldpackages": {}, "newconfigs": {}, "oldconfigs": {}, "newOptions": {}, "oldOptions": {}, "chaOptions": {"'
-        expected += removed_option + '": {"value": ' + json.dumps(removedOptVal) + ', "package": "' + removed_key + '", "config": "' + removed_conf + '"'
+        expected += removed_key + '.' + removed_conf + '.' + removed_option + '": {"value": ' + json.dumps(removedOptVal) + ', "package": "' + removed_key + '", "config": "' + removed_conf + '", "option": "' + removed_option + '"'
         expected += '}}}'
         self.assertEqual(json.loads(jsonExport), json.loads(expected))
         importTest = Diff()
@@ -244,3 +244,45 @@ class TestSetup(unittest.TestCase):
         self.assertEqual(self.confa, self.confb)
         result.revert(self.confa)
         self.assertEqual(self.confa.diff(self.confb), result)
+
+    def test_same_names(self):
+        # the same option in two sections and the same section in two packages
+        network = self.confb.packages['network']
+        network['lan'].set_option('proto', 'dhcp')
+        network['loopback'].set_option('proto', 'none')
+        self.confa.packages['dhcp']['lan'].keys.pop('start')
+        self.confb.packages['network']['lan'].keys.pop('ifname')
+        result = self.confa.diff(self.confb)
+
+        importTest = Diff()
+        importTest.importJson(result.exportJson())
+        self.assertEqual(importTest, result)
+        self.assertEqual(len(importTest['chaOptions']), 2)
+
+        importTest.apply(self.confa)
+        self.assertEqual(self.confa, self.confb)
+        self.assertEqual(self.confa.diff(self.confb), Diff())
+
+        self.confa.packages['dhcp'].pop('lan')
+        self.confa.packages['network'].pop('lan')
+        result = self.confa.diff(self.confb)
+        importTest = Diff()
+        importTest.importJson(result.exportJson())
+        self.assertEqual(len(importTest['newconfigs']), 2)
+        importTest.apply(self.confa)
+        self.assertEqual(self.confa, self.confb)
+
+    def test_import_name_keys(self):
+        # diffs written before options were keyed by their full path
+        importTest = Diff()
+        importTest.importJson('{"newpackages": {}, "oldpackages": {}, "newconfigs": {}, "oldconfigs": {}, '
+                              '"newOptions": {"proto": {"value": "dhcp", "package": "network", "config": "lan"}}, '
+                              '"oldOptions": {}, "chaOptions": {}}')
+        self.assertEqual(importTest['newOptions'], {('network', 'lan', 'proto'): 'dhcp'})
+
+    def test_apply_mismatch(self):
+        self.confb.packages['network']['lan'].set_option('proto', 'dhcp')
+        self.confb.packages['dhcp'].pop('lan')
+        result = self.confa.diff(self.confb)
+        self.assertRaises(UciNotFoundError, result.apply, Uci())
+        self.assertRaises(UciParseError, Diff().importJson, '{"newpackages": []}')
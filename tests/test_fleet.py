@@ -0,0 +1,98 @@
+from pyuci import Uci, UciParseError
+from pyuci.fleet import FleetWriter, read_fleet, write_fleet
+import io
+import json
+import os.path
+import unittest
+
+class TestFleet(unittest.TestCase):
+    def setUp(self):
+        self.maxDiff = None
+        path,filename = os.path.split(os.path.realpath(__file__))
+        self.confstring = open(os.path.join(path,'example_config')).read()
+        self.trees = []
+        for i in range(5):
+            uci = Uci()
+            uci.load_tree(self.confstring)
+            uci.packages['system']['cfg02e48a'].set_option('hostname', 'device%d' % i)
+            self.trees.append(('device%d' % i, uci))
+
+    def roundtrip(self, layout, **kwargs):
+        stream = io.StringIO()
+        write_fleet(stream, self.trees, layout=layout, block_size=2)
+        stream.seek(0)
+        return list(read_fleet(stream, **kwargs))
+
+    def check_layout(self, layout):
+        result = self.roundtrip(layout)
+        self.assertEqual([device_id for device_id, uci in result],
+                         [device_id for device_id, uci in self.trees])
+        for (device_id, uci), (expected_id, expected) in zip(result, self.trees):
+            self.assertEqual(json.loads(uci.export_json()), json.loads(expected.export_json()))
+            self.assertEqual(uci.diff(expected), Uci().diff(Uci()))
+
+    def check_selection(self, layout):
+        result = self.roundtrip(layout, devices=['device3', 'device1', 'missing'],
+                                packages=['system', 'network'])
+        self.assertEqual([device_id for device_id, uci in result], ['device1', 'device3'])
+        for device_id, uci in result:
+            self.assertEqual(sorted(uci.packages.keys()), ['network', 'system'])
+            self.assertEqual(uci.packages['system']['cfg02e48a'].keys['hostname'], device_id)
+
+        self.assertEqual(self.roundtrip(layout, devices=[]), [])
+
+    def check_duplicates(self, layout):
+        self.trees.insert(1, ('device0', Uci()))
+        result = self.roundtrip(layout, devices=['device0', 'device1'])
+        self.assertEqual([device_id for device_id, uci in result], ['device0', 'device1'])
+        self.assertEqual(json.loads(result[0][1].export_json()),
+                         json.loads(self.trees[0][1].export_json()))
+
+    def test_ndjson(self):
+        self.check_layout('ndjson')
+        self.check_selection('ndjson')
+        self.check_duplicates('ndjson')
+
+    def test_columnar(self):
+        self.check_layout('columnar')
+        self.check_selection('columnar')
+        self.check_duplicates('columnar')
+
+    def test_columnar_blocks(self):
+        stream = io.StringIO()
+        with FleetWriter(stream, layout='columnar', block_size=2) as writer:
+            for device_id, uci in self.trees:
+                writer.write(device_id, uci)
+        lines = stream.getvalue().splitlines()
+        # header and three blocks of at most two devices
+        self.assertEqual(len(lines), 4)
+        block = json.loads(lines[1])
+        self.assertEqual(block['devices'], ['device0', 'device1'])
+        self.assertEqual(len(block['strings']), len(set(block['strings'])))
+
+    def test_load_dict_copies(self):
+        tree = json.loads(self.confstring)
+        uci = Uci()
+        uci.load_dict(tree)
+        uci.packages['firewall']['cfg1292bd'].add_list('icmp_type', 'a')
+        self.assertEqual(tree, json.loads(self.confstring))
+
+    def test_invalid_stream(self):
+        self.assertRaises(UciParseError, list, read_fleet(io.StringIO('')))
+        self.assertRaises(UciParseError, list, read_fleet(io.StringIO('{"format": "other"}\n')))
+        self.assertRaises(ValueError, FleetWriter, io.StringIO(), 'unknown')
+        self.assertRaises(ValueError, FleetWriter(io.StringIO()).write, ['a'], Uci())
+
+    def test_invalid_records(self):
+        header = '{"format": "pyuci-fleet", "version": 1, "layout": "%s"}\n'
+        ndjson = ['{"packages": {}}', '[]', '{"device": ["a"], "packages": {}}',
+                  '{"device": "a", "packages": []}']
+        columnar = ['{"strings": []}', '[]', '{"strings": [], "devices": ["a"]}',
+                    '{"strings": [], "devices": ["a"], "packages": {"device": [1], "name": [0]}, '
+                    '"sections": {"package": [], "name": [], "type": [], "anonymous": []}, '
+                    '"options": {"section": [], "name": [], "value": []}}']
+        for layout, records in (('ndjson', ndjson), ('columnar', columnar)):
+            for record in records:
+                for devices in (None, ['a']):
+                    stream = io.StringIO(header % layout + record + '\n')
+                    self.assertRaises(UciParseError, list, read_fleet(stream, devices))